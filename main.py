@@ -6,23 +6,55 @@ Word Document Generation Service - Precision Formatting Version (v8.0)
 3. 严格控制子标题((1))和统计项的首行缩进。
 """
 
-import base64
+import asyncio
+import copy
+import gc
+import hashlib
 import io
+import itertools
+import logging
 import re
 import os
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from enum import Enum
 
-from fastapi import FastAPI, HTTPException
+import orjson
+import pybase64
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from lxml import etree
 from docx import Document
-from docx.shared import Pt, RGBColor
-from docx.oxml.ns import qn
+from docx.shared import RGBColor
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.table import _Row
 
-app = FastAPI(title="Word Service Precision", version="8.0.0")
+# 可选加速：设置环境变量 USE_ISAL=1 且安装了 isal 时，docx 打包/解包改用 ISA-L 的 SIMD deflate
+# （压缩约快 2 倍，但输出约大 30%）。会替换进程内 zipfile 使用的 zlib，因此必须显式开启。
+if os.environ.get("USE_ISAL") == "1":
+    try:
+        from isal import isal_zlib
+        zipfile.zlib = isal_zlib
+    except ImportError:
+        pass
+
+logger = logging.getLogger(__name__)
+
+class ORJSONResponse(JSONResponse):
+    """用 orjson 序列化响应：document_base64 动辄数 MB，orjson 编码长 ASCII 字符串远快于标准库 json"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+app = FastAPI(title="Word Service Precision", version="8.0.0", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,60 +66,161 @@ app.add_middleware(
 
 # ---------------- 核心排版逻辑 ----------------
 
-def format_run_font(run, size=10.5, bold=False):
-    """统一设置字体格式"""
-    run.font.name = 'Times New Roman'
-    run._element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
-    run.font.size = Pt(size)
-    run.bold = bold
+INDENT_2_CHARS = 480  # 首行缩进 2 字符 = 24pt = 480 twips
+_QN_FIRST_LINE = qn('w:firstLine')
+_QN_HANGING = qn('w:hanging')
+
+_QN_TCPR = qn('w:tcPr')
+_QN_P = qn('w:p')
+_QN_R = qn('w:r')
+_QN_T = qn('w:t')
+_QN_RPR = qn('w:rPr')
+_QN_PPR = qn('w:pPr')
+_QN_BR = qn('w:br')
+_QN_TAB = qn('w:tab')
+_QN_SECTPR = qn('w:sectPr')
+_QN_TC = qn('w:tc')
+_QN_TR = qn('w:tr')
+_QN_TBL = qn('w:tbl')
+_QN_BODY = qn('w:body')
+_QN_XML_SPACE = qn('xml:space')
+
+# 标准正文字体（Times New Roman / 宋体 五号），预先解析一次，写入 run 时直接克隆
+_RPR_XML = (
+    f'<w:rPr {nsdecls("w")}>'
+    '<w:rFonts w:ascii="Times New Roman" w:hAnsi="Times New Roman" w:eastAsia="宋体"/>'
+    '{bold}<w:sz w:val="21"/>'
+    '</w:rPr>'
+)
+_RPR_TEMPLATE = parse_xml(_RPR_XML.replace('{bold}', '<w:b w:val="0"/>'))
+_RPR_TEMPLATE_BOLD = parse_xml(_RPR_XML.replace('{bold}', '<w:b/>'))
+
+# 常用的段落缩进 pPr（不缩进 / 缩进 2 字符），新段落直接克隆
+_PPR_INDENT = {
+    twips: parse_xml(f'<w:pPr {nsdecls("w")}><w:ind w:firstLine="{twips}"/></w:pPr>')
+    for twips in (0, INDENT_2_CHARS)
+}
+
+# 行分类规则（模块加载时编译一次）
+_RE_HEADING = re.compile(r"^\d+[、\.]")             # 大标题 "1、"
+_RE_SUBHEAD = re.compile(r"^[\(（]\d+[\)）]")        # 子标题 "(1)"
+_KEYWORDS = ("人员投入", "设备投入", "累计工程量")  # 统计项关键词（按优先级）
+_RE_BREAK = re.compile(r"([\t\r\n])")
+
+def clear_cell(tc):
+    """
+    清空单元格 (w:tc)：删除 tcPr 以外的全部内容，只留一个空段落 (w:p) 并返回它。
+    等价于 cell.text = ""，但不经过 python-docx 逐段逐 run 的包装与删除。
+    """
+    for child in list(tc):
+        if child.tag != _QN_TCPR:
+            tc.remove(child)
+    return etree.SubElement(tc, _QN_P)
+
+def set_cell_text(tc, text: str):
+    """
+    清空单元格 (w:tc) 并写入一个标准字体的 run。
+    等价于 cell.text = "" + add_run 再套用标准字体，但直接构造 OXML，不经过 python-docx 包装对象。
+    """
+    append_text_run(clear_cell(tc), text)
+
+def overwrite_cell_text(tc, text: str):
+    """
+    覆盖单元格 (w:tc) 文本并保留模板原有格式：沿用第一个 w:t 所在 run 的 rPr 重写其内容，
+    删掉其余 run 与其余段落；单元格里原本没有文字时退回 set_cell_text 按标准字体新建。
+    """
+    first_t = next(tc.iter(_QN_T), None)
+    if first_t is None:
+        set_cell_text(tc, text)
+        return
+    # 只保留第一个 w:t 所在的段落，单元格收成一行（多余的空段落会撑高整行）
+    keep = first_t
+    while keep.getparent() is not tc:
+        keep = keep.getparent()
+    for child in list(tc):
+        if child is not keep and child.tag != _QN_TCPR:
+            tc.remove(child)
+    first_r = first_t.getparent()
+    for r in list(tc.iter(_QN_R)):
+        if r is not first_r:
+            r.getparent().remove(r)
+    for child in list(first_r):
+        if child.tag != _QN_RPR:
+            first_r.remove(child)
+    append_run_text(first_r, text)
+
+def append_text_run(p_el, text: str, bold=False):
+    """
+    在段落 (w:p) 末尾追加一个标准字体的 w:r。
+    与 python-docx 的 run.text 一致：\n、\r 各写成一个 w:br，\t 写成 w:tab。
+    """
+    r = etree.SubElement(p_el, _QN_R)
+    r.append(copy.deepcopy(_RPR_TEMPLATE_BOLD if bold else _RPR_TEMPLATE))
+    append_run_text(r, text)
+    return r
+
+def append_run_text(r, text: str):
+    """把文本写入 w:r 末尾：\n、\r 各写成一个 w:br，\t 写成 w:tab，其余为 w:t（同 python-docx 的 run.text）"""
+    for piece in _RE_BREAK.split(text):
+        if piece == "\n" or piece == "\r":
+            etree.SubElement(r, _QN_BR)
+        elif piece == "\t":
+            etree.SubElement(r, _QN_TAB)
+        elif piece:
+            t = etree.SubElement(r, _QN_T)
+            t.text = piece
+            if piece != piece.strip():
+                t.set(_QN_XML_SPACE, "preserve")
+
+def set_first_line_indent(p_el, twips: int):
+    """直接写入段落 w:pPr/w:ind 的首行缩进（单位 twips，1pt = 20 twips），绕过 paragraph_format"""
+    if twips in _PPR_INDENT and p_el.find(_QN_PPR) is None:
+        # 新建段落尚无 pPr：直接克隆预置的缩进 pPr
+        p_el.insert(0, copy.deepcopy(_PPR_INDENT[twips]))
+        return
+    ind = p_el.get_or_add_pPr().get_or_add_ind()
+    ind.attrib.pop(_QN_HANGING, None)
+    ind.set(_QN_FIRST_LINE, str(twips))
 
-def process_and_add_line(cell, line_text):
+def process_and_add_line(tc, line_text, p=None) -> bool:
     """
     智能处理每一行的格式：缩进、加粗、分割
+    tc: 目标单元格 (w:tc)；段落与 run 直接按 OXML 构造，不经过 python-docx 包装对象。
+    p: 可复用的空段落 w:p（单元格刚清空后留下的那个）；为 None 时新建段落。
+    返回是否写入了内容（空行跳过）。
     """
     line_text = line_text.strip()
-    if not line_text: return
+    if not line_text: return False
 
     # 创建新段落（注意：不使用 add_run("\n") 而是 add_paragraph 以便单独控制每一行的缩进）
-    # 如果是单元格刚清空后的第一个段落，直接使用，否则新建
-    if len(cell.paragraphs) == 1 and not cell.paragraphs[0].text:
-        p = cell.paragraphs[0]
-    else:
-        p = cell.add_paragraph()
+    if p is None:
+        p = etree.SubElement(tc, _QN_P)
 
     # --- 1. 规则匹配 ---
     
     # 规则A：大标题 (例如 "1、右岸施工营地")
     # 特征：数字开头 + 顿号或点
-    if re.match(r"^\d+[、\.]", line_text):
-        p.paragraph_format.first_line_indent = Pt(0) # 【关键】强制不缩进
-        run = p.add_run(line_text)
-        format_run_font(run, bold=True) # 大标题整行加粗
-        return
+    if _RE_HEADING.match(line_text):
+        set_first_line_indent(p, 0) # 【关键】强制不缩进
+        append_text_run(p, line_text, bold=True) # 大标题整行加粗
+        return True
 
     # 规则B：统计项 (例如 "人员投入：...")
     # 特征：包含特定关键词
-    keywords = ["人员投入", "设备投入", "累计工程量"]
-    hit_keyword = None
-    for kw in keywords:
-        if kw in line_text:
-            hit_keyword = kw
-            break
+    hit_keyword = next((kw for kw in _KEYWORDS if kw in line_text), None)
     
     if hit_keyword:
-        p.paragraph_format.first_line_indent = Pt(24) # 【关键】强制缩进 2 字符
+        set_first_line_indent(p, INDENT_2_CHARS) # 【关键】强制缩进 2 字符
         
         # 【局部加粗逻辑】
         # 将文本切分为两部分：关键词前缀(加粗) + 剩余内容(不加粗)
         # 例如 "人员投入：张三" -> "人员投入：" (粗) + " 张三" (细)
         
-        # 尝试找到冒号的位置
-        split_index = -1
-        if "：" in line_text:
-            split_index = line_text.index("：") + 1
-        elif ":" in line_text:
-            split_index = line_text.index(":") + 1
-        else:
+        # 尝试找到冒号的位置（优先全角冒号）
+        split_index = line_text.find("：") + 1
+        if not split_index:
+            split_index = line_text.find(":") + 1
+        if not split_index:
             # 如果没有冒号，就只加粗关键词本身
             split_index = line_text.index(hit_keyword) + len(hit_keyword)
             
@@ -95,61 +228,224 @@ def process_and_add_line(cell, line_text):
         content = line_text[split_index:]
         
         # 写入前缀（加粗）
-        run1 = p.add_run(prefix)
-        format_run_font(run1, bold=True)
+        append_text_run(p, prefix, bold=True)
         
         # 写入内容（正常）
-        run2 = p.add_run(content)
-        format_run_font(run2, bold=False)
-        return
+        append_text_run(p, content)
+        return True
 
     # 规则C：子标题 / 具体内容 (例如 "(1) 场地精平")
     # 特征：以 (数字) 或 （数字） 开头
-    if re.match(r"^[\(（]\d+[\)）]", line_text):
-        p.paragraph_format.first_line_indent = Pt(24) # 【关键】强制缩进 2 字符
-        run = p.add_run(line_text)
-        format_run_font(run, bold=False) # 内容不加粗
-        return
+    if _RE_SUBHEAD.match(line_text):
+        set_first_line_indent(p, INDENT_2_CHARS) # 【关键】强制缩进 2 字符
+        append_text_run(p, line_text) # 内容不加粗
+        return True
 
     # 规则D：其他普通文本
     # 默认缩进2字符（因为通常是正文延续），或者0？
     # 根据你的截图，如果不符合上述规则，通常是正文描述，建议缩进2字符对齐
-    p.paragraph_format.first_line_indent = Pt(24)
-    run = p.add_run(line_text)
-    format_run_font(run, bold=False)
+    set_first_line_indent(p, INDENT_2_CHARS)
+    append_text_run(p, line_text)
+    return True
 
 # ---------------- 辅助函数 ----------------
 
-def find_target_table(doc: Document, index: int) -> Optional[Any]:
-    if 0 <= index < len(doc.tables):
-        return doc.tables[index]
-    return None
+_NSMAP = {"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"}
+
+# 附表行定位：一次 XPath 筛出文本包含 $name 的候选 w:tr，
+# 再按网格列（考虑 gridSpan / vMerge 合并）核对名称列，w:tc 的位置不等于列号
+_ROW_NAME_XPATH = etree.XPath(
+    "./w:tr[contains(string(.), $name)]",
+    namespaces=_NSMAP,
+)
+
+# 已解析模板缓存：Dify/n8n 工作流会反复提交同一份模板，按内容哈希缓存解析结果，
+# 命中时直接深拷贝，跳过 unzip + XML 解析。缓存中的文档只读，从不直接修改。
+# 上一步刚生成的一次性文档只会出现一次：同一内容第二次出现才缓存，
+# 首次出现直接解析返回，不付深拷贝的代价，也不挤掉真正的模板。
+# 缓存按解析后的常驻内存计量：文字多的 docx 解析后可达压缩体积的 150~250 倍。
+DOC_CACHE_MAX_MEMORY = 128 * 1024 * 1024  # 缓存文档解析后的内存总量上限（估算）
+DOC_CACHE_MAX_DOC = 4 * 1024 * 1024       # 超过该大小的 docx 不缓存
+_PARSED_BYTES_PER_ELEMENT = 400           # 实测每个已解析 XML 元素约占 360 字节
+_DOC_SEEN_SIZE = 256                      # 记录最近出现过的文档哈希个数
+_doc_cache: "OrderedDict[bytes, Tuple[Any, int]]" = OrderedDict()
+_doc_cache_memory = 0
+_doc_seen: "OrderedDict[bytes, None]" = OrderedDict()
+_doc_cache_lock = threading.Lock()
+
+def estimate_parsed_size(doc) -> int:
+    """估算已解析 Document 的常驻内存：XML 部件按元素个数计，图片等二进制部件按原始大小计"""
+    size = 0
+    for part in doc.part.package.iter_parts():
+        element = getattr(part, "_element", None)
+        if element is not None:
+            size += sum(1 for _ in element.iter()) * _PARSED_BYTES_PER_ELEMENT
+        else:
+            size += len(part.blob)
+    return size
 
-def update_table_row(table, row_name: str, today: str, total: str):
-    """表格行更新逻辑"""
-    if not table.rows: return
+def load_document(file_bytes: bytes):
+    """解析 docx 字节流，返回可自由修改的 Document（反复出现的内容只解析一次）"""
+    global _doc_cache_memory
+    if len(file_bytes) > DOC_CACHE_MAX_DOC:
+        return Document(io.BytesIO(file_bytes))
+
+    digest = hashlib.blake2b(file_bytes, digest_size=16).digest()
+    with _doc_cache_lock:
+        entry = _doc_cache.get(digest)
+        if entry is not None:
+            _doc_cache.move_to_end(digest)
+        else:
+            seen_before = digest in _doc_seen
+            if not seen_before:
+                _doc_seen[digest] = None
+                if len(_doc_seen) > _DOC_SEEN_SIZE:
+                    _doc_seen.popitem(last=False)
+    # 深拷贝在锁外进行：缓存中的文档只读，并发命中不必互相等待
+    if entry is not None:
+        return copy.deepcopy(entry[0])
+
+    doc = Document(io.BytesIO(file_bytes))
+    if not seen_before:
+        return doc
+
+    cost = estimate_parsed_size(doc)
+    if cost > DOC_CACHE_MAX_MEMORY // 4:
+        return doc  # 单份文档占用过大，不值得常驻
+    with _doc_cache_lock:
+        _doc_seen.pop(digest, None)
+        old = _doc_cache.pop(digest, None)
+        if old is not None:
+            _doc_cache_memory -= old[1]
+        _doc_cache[digest] = (doc, cost)
+        _doc_cache_memory += cost
+        while _doc_cache_memory > DOC_CACHE_MAX_MEMORY:
+            _, (_, evicted) = _doc_cache.popitem(last=False)
+            _doc_cache_memory -= evicted
+    return copy.deepcopy(doc)
+
+# python-docx 的 Document 与各部件之间存在循环引用，请求结束后要等 GC 第 2 代回收才释放，
+# 长时间运行的 worker 会因此持续涨内存。
+GC_EVERY = 50
+_released_count = itertools.count(1)
+
+def release_document(doc):
+    """请求处理完毕后释放文档：立即清空主文档 XML 树，并每 GC_EVERY 份文档触发一次完整回收"""
+    doc.element.clear()
+    if next(_released_count) % GC_EVERY == 0:
+        gc.collect()
+
+# 超过该大小的 docx 以流式 JSON 返回：分块读取、分块编码 base64，
+# 内存中不再同时存在整份 docx、整段 base64 字符串和 JSON 副本
+STREAM_THRESHOLD = 4 * 1024 * 1024
+_STREAM_CHUNK = 3 * 256 * 1024  # 3 的倍数，块与块之间不会出现 '=' 填充
+
+def save_document(doc):
+    """保存文档到临时文件对象：不超过 STREAM_THRESHOLD 时留在内存，更大的自动落盘，限制峰值内存"""
+    out = tempfile.SpooledTemporaryFile(max_size=STREAM_THRESHOLD)
+    doc.save(out)
+    return out
+
+def document_response(out):
+    """
+    save_document / patch_document_xml 产出的文件对象 → 接口响应（负责关闭文件）。
+    响应体均为 {"success": true, "document_base64": "..."}。
+    """
+    size = out.tell()
+    out.seek(0)
+    if size <= STREAM_THRESHOLD:
+        with out:
+            return {"success": True, "document_base64": pybase64.b64encode_as_string(out.read())}
+
+    def body():
+        with out:
+            yield b'{"success":true,"document_base64":"'
+            while chunk := out.read(_STREAM_CHUNK):
+                yield pybase64.b64encode(chunk)
+            yield b'"}'
+    return StreamingResponse(body(), media_type="application/json")
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+def docx_response(out):
+    """save_document 产出的文件对象 → 原始 docx 二进制响应（负责关闭文件），不经过 base64"""
+    size = out.tell()
+    out.seek(0)
+    if size <= STREAM_THRESHOLD:
+        with out:
+            return Response(out.read(), media_type=DOCX_MEDIA_TYPE)
+
+    def body():
+        with out:
+            while chunk := out.read(_STREAM_CHUNK):
+                yield chunk
+    return StreamingResponse(body(), media_type=DOCX_MEDIA_TYPE,
+                             headers={"Content-Length": str(size)})
+
+def resolve_table_columns(table) -> Optional[Tuple[int, int, int]]:
+    """根据首行网格列数确定 (名称列, 本日列, 累计列)；空表返回 None"""
+    first_tr = table._tbl.find(_QN_TR)
+    if first_tr is None: return None
     
-    name_col = 1
-    cols_count = len(table.rows[0].cells)
+    # 按网格列计数（同 len(table.rows[0].cells)）：首行常是横跨全表的合并标题，只有一个 w:tc
+    cols_count = sum(tc.grid_span for tc in first_tr.tc_lst)
     today_col = 4 if cols_count > 4 else cols_count - 2
     total_col = 5 if cols_count > 5 else cols_count - 1
+    return 1, today_col, total_col
+
+def update_table_row(table, row_name: str, today: str, total: str,
+                     columns: Optional[Tuple[int, int, int]] = None):
+    """表格行更新逻辑；columns 为 resolve_table_columns 的结果，批量更新同一表格时可复用"""
+    # "-" / 空值表示不更新；两项都不更新时无需定位行
+    write_today = bool(today) and today != "-"
+    write_total = bool(total) and total != "-"
+    if not (write_today or write_total): return
     
-    for row in table.rows:
-        if len(row.cells) <= max(name_col, today_col, total_col): continue
-        cell_text = row.cells[name_col].text.strip()
-        if row_name in cell_text: 
-            # 填入数字时也应用字体规范
-            if today and today != "-":
-                cell = row.cells[today_col]
-                cell.text = ""
-                run = cell.paragraphs[0].add_run(str(today))
-                format_run_font(run)
-            if total and total != "-":
-                cell = row.cells[total_col]
-                cell.text = ""
-                run = cell.paragraphs[0].add_run(str(total))
-                format_run_font(run)
-            return
+    if columns is None:
+        columns = resolve_table_columns(table)
+    if columns is None: return
+    name_col, today_col, total_col = columns
+    
+    max_col = max(name_col, today_col, total_col)
+    for tr in _ROW_NAME_XPATH(table._tbl, name=row_name):
+        cells = _Row(tr, table).cells  # 每个网格列一个单元格，合并单元格重复出现
+        if len(cells) <= max_col: continue
+        if row_name not in cells[name_col].text.strip(): continue
+        
+        # 直接改写模板里已有的数字，沿用原格式；空单元格按字体规范新建
+        if write_today:
+            overwrite_cell_text(cells[today_col]._tc, str(today))
+        if write_total:
+            overwrite_cell_text(cells[total_col]._tc, str(total))
+        return
+
+# 只改动正文 XML 的接口（日期天气、人员统计）不必经过 python-docx 的整包读写：
+# 直接从 ZIP 中取出主文档部件修改，其余部件（styles、theme、media…）原样拷贝。
+_RELS_XML = "_rels/.rels"
+_OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+
+def find_main_document_part(zf: zipfile.ZipFile) -> str:
+    """从包关系中找到主文档部件名（通常是 word/document.xml）"""
+    rels = etree.fromstring(zf.read(_RELS_XML))
+    for rel in rels:
+        if rel.get("Type") == _OFFICE_DOCUMENT_REL:
+            return rel.get("Target").lstrip("/")
+    raise ValueError("无效的 docx：缺少主文档部件")
+
+def patch_document_xml(file_bytes: bytes, mutate):
+    """解析主文档 XML 交给 mutate(root) 就地修改，重新打包到临时文件对象（同 save_document）后返回"""
+    out = tempfile.SpooledTemporaryFile(max_size=STREAM_THRESHOLD)
+    with zipfile.ZipFile(io.BytesIO(file_bytes)) as src:
+        part_name = find_main_document_part(src)
+        root = parse_xml(src.read(part_name))
+        mutate(root)
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                if info.filename == part_name:
+                    dst.writestr(info, etree.tostring(root, encoding="UTF-8", standalone=True))
+                else:
+                    dst.writestr(info, src.read(info))
+    return out
 
 # ---------------- 模型定义 ----------------
 
@@ -184,97 +480,174 @@ class UpdateAppendixRequest(BaseModel):
     feishu_token: Optional[str] = None
 
 # ---------------- API 接口实现 ----------------
+# base64 解码、XML 解析与 docx 打包都是同步的 CPU 密集操作，放到线程池执行，
+# 不阻塞事件循环；lxml 在解析/序列化时释放 GIL，并发请求可以真正并行。
 
-@app.post("/fill-template")
-async def fill_template(req: FillTemplateRequest):
+MAX_BASE64_SIZE = 40 * 1024 * 1024  # base64 文本上限（约 30MB docx）
+MAX_DOCX_SIZE = MAX_BASE64_SIZE // 4 * 3  # 二进制上传的 docx 上限，与 base64 上限对应
+
+def check_payload_size(document_base64: str):
+    """超大文档直接拒绝（413），避免解码 + 解析时内存暴涨"""
+    if len(document_base64) > MAX_BASE64_SIZE:
+        raise HTTPException(status_code=413, detail="文档过大")
+
+def fill_template_content(doc, content: str, table_index: int, row_index: int, col_index: int):
+    """把多行内容按排版规则写入指定表格单元格（/fill-template 与 /fill-template-binary 共用）"""
+    tables = doc.tables
+    if len(tables) > table_index:
+        table = tables[table_index]
+        if len(table.rows) > row_index:
+            col_count = len(table.columns)
+            if not 0 <= col_index < col_count:
+                raise IndexError(f"col_index 超出范围：表格共 {col_count} 列")
+            cell = table.cell(row_index, col_index)
+            
+            # 清空单元格，留下的空段落给第一条有效行复用，之后每行新建段落
+            tc = cell._tc
+            first_p = clear_cell(tc)
+            
+            # 逐行处理，精确控制格式
+            lines = content.split('\n')
+            for line in lines:
+                if process_and_add_line(tc, line, first_p):
+                    first_p = None
+
+def fill_template_sync(req: FillTemplateRequest):
     try:
-        file_bytes = base64.b64decode(req.template_base64)
-        doc = Document(io.BytesIO(file_bytes))
-        
-        if doc.tables and len(doc.tables) > req.table_index:
-            table = doc.tables[req.table_index]
-            if len(table.rows) > req.row_index:
-                cell = table.cell(req.row_index, req.col_index)
-                
-                # 清空单元格
-                cell.text = "" 
-                
-                # 逐行处理，精确控制格式
-                lines = req.content.split('\n')
-                for line in lines:
-                    process_and_add_line(cell, line)
+        doc = load_document(pybase64.b64decode(req.template_base64, validate=False))
+        fill_template_content(doc, req.content, req.table_index, req.row_index, req.col_index)
         
-        out = io.BytesIO()
-        doc.save(out)
-        return {"success": True, "document_base64": base64.b64encode(out.getvalue()).decode()}
+        out = save_document(doc)
+        release_document(doc)
+        return document_response(out)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("fill-template 处理失败")
         return {"success": False, "message": str(e)}
 
-@app.post("/update-date-weather")
-async def update_date_weather(req: UpdateDateWeatherRequest):
+def fill_template_binary_sync(file_bytes: bytes, content: str,
+                              table_index: int, row_index: int, col_index: int):
+    # 成功时响应体是 docx 文件，失败必须返回非 2xx 状态码，避免调用方把错误 JSON 当作文档保存
     try:
-        file_bytes = base64.b64decode(req.document_base64)
-        doc = Document(io.BytesIO(file_bytes))
+        doc = load_document(file_bytes)
+    except Exception as e:
+        logger.warning("fill-template-binary 上传的文件不是有效的 docx: %s", e)
+        return ORJSONResponse({"success": False, "message": str(e)}, status_code=400)
+    try:
+        fill_template_content(doc, content, table_index, row_index, col_index)
         
+        out = save_document(doc)
+        release_document(doc)
+        return docx_response(out)
+    except IndexError as e:
+        # 单元格位置超出表格范围：调用方参数错误，不是服务端故障
+        logger.warning("fill-template-binary 单元格位置无效: %s", e)
+        return ORJSONResponse({"success": False, "message": str(e)}, status_code=400)
+    except Exception as e:
+        logger.exception("fill-template-binary 处理失败")
+        return ORJSONResponse({"success": False, "message": str(e)}, status_code=500)
+
+def update_date_weather_sync(req: UpdateDateWeatherRequest):
+    try:
         now = datetime.now()
         date_str = f"{now.year}年{now.month}月{now.day}日"
         weather_str = "天气：晴                气温：20℃~30℃"
         
-        if doc.tables:
-            table = doc.tables[0]
-            if len(table.rows) > 0:
-                cells = table.rows[0].cells
-                if len(cells) > 0: 
-                    cells[0].text = ""
-                    run = cells[0].paragraphs[0].add_run(date_str)
-                    format_run_font(run)
-                if len(cells) > 1: 
-                    cells[-1].text = ""
-                    run = cells[-1].paragraphs[0].add_run(weather_str)
-                    format_run_font(run)
+        def fill_date_weather(root):
+            # 首个表格的首行：第一格写日期，最后一格写天气
+            tbl = root.find(_QN_BODY).find(_QN_TBL)
+            if tbl is None: return
+            tr = tbl.find(_QN_TR)
+            if tr is None: return
+            tcs = list(tr.iterchildren(_QN_TC))
+            if len(tcs) > 0:
+                set_cell_text(tcs[0], date_str)
+            if len(tcs) > 1:
+                set_cell_text(tcs[-1], weather_str)
         
-        out = io.BytesIO()
-        doc.save(out)
-        return {"success": True, "document_base64": base64.b64encode(out.getvalue()).decode()}
+        out = patch_document_xml(pybase64.b64decode(req.document_base64, validate=False), fill_date_weather)
+        return document_response(out)
     except Exception as e:
         return {"success": False, "message": str(e)}
 
-@app.post("/update-personnel-stats")
-async def update_personnel_stats(req: UpdatePersonnelRequest):
+def update_personnel_stats_sync(req: UpdatePersonnelRequest):
     try:
-        file_bytes = base64.b64decode(req.document_base64)
-        doc = Document(io.BytesIO(file_bytes))
+        def append_personnel(root):
+            # 统计信息在文末（w:sectPr 之前）追加，默认不需要特殊缩进，但需要字体规范
+            body = root.find(_QN_BODY)
+            p = etree.Element(_QN_P)
+            append_text_run(p, "\n" + req.personnel_text)
+            sect_pr = body.find(_QN_SECTPR)
+            if sect_pr is not None:
+                sect_pr.addprevious(p)
+            else:
+                body.append(p)
         
-        # 统计信息在文末追加，默认不需要特殊缩进，但需要字体规范
-        p = doc.add_paragraph()
-        run = p.add_run("\n" + req.personnel_text)
-        format_run_font(run)
-        
-        out = io.BytesIO()
-        doc.save(out)
-        return {"success": True, "document_base64": base64.b64encode(out.getvalue()).decode()}
+        out = patch_document_xml(pybase64.b64decode(req.document_base64, validate=False), append_personnel)
+        return document_response(out)
     except Exception as e:
         return {"success": False, "message": str(e)}
 
-@app.post("/update-appendix-tables")
-async def update_appendix_tables(req: UpdateAppendixRequest):
+def update_appendix_tables_sync(req: UpdateAppendixRequest):
     try:
-        file_bytes = base64.b64decode(req.document_base64)
-        doc = Document(io.BytesIO(file_bytes))
+        doc = load_document(pybase64.b64decode(req.document_base64, validate=False))
         
+        # 表格列表每次访问 doc.tables 都会重新构建，整个请求只取一次；
+        # 同一表格的列位置也只解析一次
+        tables = doc.tables
+        columns_by_table: Dict[int, Optional[Tuple[int, int, int]]] = {}
         for item in req.data:
-            target_table = find_target_table(doc, item.table_index)
-            if target_table:
-                update_table_row(target_table, item.row_name, item.today_qty, item.total_qty)
+            if 0 <= item.table_index < len(tables):
+                table = tables[item.table_index]
+                if item.table_index not in columns_by_table:
+                    columns_by_table[item.table_index] = resolve_table_columns(table)
+                update_table_row(table, item.row_name, item.today_qty, item.total_qty,
+                                 columns_by_table[item.table_index])
         
-        out = io.BytesIO()
-        doc.save(out)
-        return {"success": True, "document_base64": base64.b64encode(out.getvalue()).decode()}
+        out = save_document(doc)
+        release_document(doc)
+        return document_response(out)
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+@app.post("/fill-template")
+async def fill_template(req: FillTemplateRequest):
+    check_payload_size(req.template_base64)
+    return await asyncio.to_thread(fill_template_sync, req)
+
+# 大文档推荐使用二进制接口：multipart 上传 docx，直接返回 docx 文件，省去双向 base64 编解码
+# （体积多 33%、CPU 与内存各多一份）。base64 接口保留给 Dify 等只能收发 JSON 的调用方。
+@app.post("/fill-template-binary")
+async def fill_template_binary(
+    file: UploadFile = File(...),
+    content: str = Form(...),
+    table_index: int = Form(0),
+    row_index: int = Form(4),
+    col_index: int = Form(2),
+):
+    if file.size is not None and file.size > MAX_DOCX_SIZE:
+        raise HTTPException(status_code=413, detail="文档过大")
+    file_bytes = await file.read()
+    if len(file_bytes) > MAX_DOCX_SIZE:  # 客户端未声明大小时 file.size 为 None
+        raise HTTPException(status_code=413, detail="文档过大")
+    return await asyncio.to_thread(
+        fill_template_binary_sync, file_bytes, content, table_index, row_index, col_index
+    )
+
+@app.post("/update-date-weather")
+async def update_date_weather(req: UpdateDateWeatherRequest):
+    check_payload_size(req.document_base64)
+    return await asyncio.to_thread(update_date_weather_sync, req)
+
+@app.post("/update-personnel-stats")
+async def update_personnel_stats(req: UpdatePersonnelRequest):
+    check_payload_size(req.document_base64)
+    return await asyncio.to_thread(update_personnel_stats_sync, req)
+
+@app.post("/update-appendix-tables")
+async def update_appendix_tables(req: UpdateAppendixRequest):
+    check_payload_size(req.document_base64)
+    return await asyncio.to_thread(update_appendix_tables_sync, req)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
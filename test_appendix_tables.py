@@ -0,0 +1,54 @@
+"""附表更新的回归检查（离线运行：python -m pytest test_appendix_tables.py）"""
+
+from docx import Document
+from docx.oxml.ns import qn
+
+from main import update_table_row
+
+
+def make_table(rows=4, cols=6):
+    doc = Document()
+    table = doc.add_table(rows=rows, cols=cols)
+    for i, header in enumerate(["序号", "名称", "单位", "设计量", "本日", "累计"][:cols]):
+        table.cell(0, i).text = header
+    for r in range(1, rows):
+        for c, value in enumerate([str(r), f"项目{r}", "m3", "100", "0", "0"][:cols]):
+            table.cell(r, c).text = value
+    return table
+
+
+def row_texts(table, r):
+    return [tc.text for tc in table.rows[r].cells]
+
+
+def test_name_cell_spanning_two_columns():
+    table = make_table()
+    table.cell(2, 1).merge(table.cell(2, 2))  # 名称列横跨两列，该行只剩 5 个 w:tc
+    update_table_row(table, "项目2", "12", "345")
+    cells = row_texts(table, 2)
+    assert cells[4] == "12"
+    assert cells[5] == "345"
+
+
+def test_merged_title_row():
+    table = make_table()
+    table.cell(0, 0).merge(table.cell(0, 5))  # 首行为横跨全表的标题，只有一个 w:tc
+    update_table_row(table, "项目3", "12", "345")
+    assert row_texts(table, 3) == ["3", "项目3", "m3", "100", "12", "345"]
+
+
+def test_multi_paragraph_cell_collapses_to_one_line():
+    table = make_table()
+    cell = table.cell(1, 4)
+    cell.add_paragraph("（估算）")
+    update_table_row(table, "项目1", "12", "-")
+    assert [p.text for p in cell.paragraphs] == ["12"]
+
+
+def test_overwrite_writes_breaks_and_tabs_like_run_text():
+    table = make_table()
+    update_table_row(table, "项目1", "12\n(估)", "3\t4")
+    cells = table.rows[1].cells
+    assert cells[4].text == "12\n(估)"
+    assert cells[5].text == "3\t4"
+    assert "\n" not in "".join(t.text for t in cells[4]._tc.iter(qn("w:t")))
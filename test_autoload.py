@@ -1,23 +1,35 @@
 import requests
-import json
-import base64
+import orjson
+from pybase64 import b64decode
 
-# 测试不传模板时自动加载
-r = requests.post('http://localhost:8000/generate-from-template', json={
+# 请求体是固定的，模块加载时序列化一次，每次请求直接发送字节
+PAYLOAD = orjson.dumps({
     'chinese_data': '[{"seq":1,"location":"右岸道路","content":"测试内容","quantity":"100m","shift":""}]',
     'english_data': '{"translated_data":[{"seq":1,"location_en":"Right Bank Roads","content_en":"Test content","quantity_en":"100m","remarks_en":""}]}'
 })
-result = r.json()
+HEADERS = {'Content-Type': 'application/json'}
 
-if result.get('success'):
-    print('自动加载模板成功!')
-    print(f"天气信息: {result.get('weather_info')}")
-    
-    # 保存测试文件
-    with open('test_cn.docx', 'wb') as f:
-        f.write(base64.b64decode(result['cn_document_base64']))
-    with open('test_en.docx', 'wb') as f:
-        f.write(base64.b64decode(result['en_document_base64']))
-    print('文档已保存: test_cn.docx, test_en.docx')
-else:
-    print('错误:', result)
+
+def main(session):
+    # 测试不传模板时自动加载
+    r = session.post('http://localhost:8000/generate-from-template', data=PAYLOAD, headers=HEADERS)
+    result = orjson.loads(r.content)
+
+    if result.get('success'):
+        print('自动加载模板成功!')
+        print(f"天气信息: {result.get('weather_info')}")
+        
+        # 保存测试文件
+        with open('test_cn.docx', 'wb') as f:
+            f.write(b64decode(result['cn_document_base64']))
+        with open('test_en.docx', 'wb') as f:
+            f.write(b64decode(result['en_document_base64']))
+        print('文档已保存: test_cn.docx, test_en.docx')
+    else:
+        print('错误:', result)
+
+
+if __name__ == '__main__':
+    # 复用同一个 Session（keep-alive），多次调用 main() 时不必重复建立连接
+    with requests.Session() as session:
+        main(session)
@@ -0,0 +1,45 @@
+"""/fill-template-binary 的回归检查（离线运行：python -m pytest test_fill_template_binary.py）"""
+
+import io
+
+from docx import Document
+from fastapi.testclient import TestClient
+
+from main import DOCX_MEDIA_TYPE, app
+
+client = TestClient(app)
+
+
+def make_template(rows=5, cols=3):
+    doc = Document()
+    doc.add_table(rows=rows, cols=cols)
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def post(file_bytes, **form):
+    form.setdefault("content", "1、右岸施工营地\n人员投入：10人")
+    return client.post("/fill-template-binary",
+                       files={"file": ("template.docx", file_bytes)},
+                       data={k: str(v) for k, v in form.items()})
+
+
+def test_returns_filled_docx():
+    r = post(make_template(), row_index=4, col_index=2)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == DOCX_MEDIA_TYPE
+    cell = Document(io.BytesIO(r.content)).tables[0].cell(4, 2)
+    assert cell.text == "1、右岸施工营地\n人员投入：10人"
+
+
+def test_invalid_docx_is_bad_request():
+    r = post(b"not a docx")
+    assert r.status_code == 400
+    assert r.json()["success"] is False
+
+
+def test_column_out_of_range_is_bad_request():
+    r = post(make_template(), row_index=4, col_index=9)
+    assert r.status_code == 400
+    assert "col_index" in r.json()["message"]
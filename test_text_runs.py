@@ -0,0 +1,25 @@
+"""直接构造 OXML 的文本写入与 python-docx 行为一致性的回归检查（离线运行：python -m pytest test_text_runs.py）"""
+
+import pytest
+from docx import Document
+from lxml import etree
+
+from main import _QN_RPR, append_text_run
+
+
+def run_content(r):
+    """w:r 中除 rPr 以外的内容，序列化后用于比较"""
+    return [etree.tostring(child) for child in r if child.tag != _QN_RPR]
+
+
+@pytest.mark.parametrize("text", [
+    "人员: 10\r\n设备: 3",
+    "a\rb\nc\td",
+    " 前后空格 ",
+    "\n\n",
+])
+def test_append_text_run_matches_run_text(text):
+    p = Document().add_paragraph()
+    expected = p.add_run()
+    expected.text = text
+    assert run_content(append_text_run(p._p, text)) == run_content(expected._r)